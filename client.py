@@ -6,6 +6,7 @@ from typing import Self
 from aioconsole import ainput
 
 from settings import Settings
+from utils import hide_secrets
 
 HELP_FILE = "help.txt"
 SERVER_SIDE_COMMANDS = [
@@ -14,7 +15,9 @@ SERVER_SIDE_COMMANDS = [
     "SEND",
     "CANCEL",
     "HISTORY",
-    "REPORT"
+    "REPORT",
+    "SEARCH",
+    "PROFILE"
 ]
 
 logger = logging.getLogger(__name__)
@@ -75,7 +78,7 @@ class Client:
         return self._settings.port
 
     async def _send(self, request: str) -> None:
-        logger.info("Send: %s", request)
+        logger.info("Send: %s", hide_secrets(request))
         request_in_bytes: bytes = str.encode(request)
         self._writer.write(request_in_bytes)
         await self._writer.drain()
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime as dt
+from types import FrameType
+from typing import Iterator, Optional
+
+logger = logging.getLogger()
+
+
+@dataclass
+class CommandStats:
+    calls: int = 0
+    wall_time: float = 0.0  # in seconds
+    cpu_time: float = 0.0  # in seconds
+    max_wall_time: float = 0.0  # in seconds
+
+    def __repr__(self):
+        return (f"calls {self.calls}, wall {self.wall_time * 1000:.3f} ms, cpu {self.cpu_time * 1000:.3f} ms, "
+                f"max wall {self.max_wall_time * 1000:.3f} ms")
+
+
+class Profiler:
+    def __init__(self, slow_command_threshold: float, stall_threshold: float, sampling_interval: float,
+                 profiles_directory: str) -> None:
+        self.slow_command_threshold: float = slow_command_threshold
+        self._stall_threshold: float = stall_threshold
+        self._sampling_interval: float = sampling_interval
+        self._profiles_directory: str = profiles_directory
+        self._is_enabled: bool = False
+        self._is_capturing: bool = False
+        self._commands_stats: dict[str, CommandStats] = {}
+        self._loop_thread_id: Optional[int] = None
+        self._expected_beat: float = 0.0  # time when the next heartbeat is due
+        self._heartbeat_handle: Optional[asyncio.TimerHandle] = None
+        self._watchdog_stop: Optional[threading.Event] = None
+
+    @property
+    def is_enabled(self) -> bool:
+        return self._is_enabled
+
+    @property
+    def commands_stats(self) -> dict[str, CommandStats]:
+        return self._commands_stats
+
+    # Must be called from the event loop thread
+    def enable(self) -> None:
+        if self._is_enabled:
+            return
+
+        logger.info("Profiling is enabled")
+        self._is_enabled = True
+        self._commands_stats = {}
+        self._loop_thread_id = threading.get_ident()
+        self._beat()
+
+        self._watchdog_stop = threading.Event()
+        watchdog = threading.Thread(target=self._watch_loop, args=(self._watchdog_stop,), daemon=True)
+        watchdog.start()
+
+    def disable(self) -> None:
+        if not self._is_enabled:
+            return
+
+        logger.info("Profiling is disabled")
+        self._is_enabled = False
+        self._heartbeat_handle.cancel()
+        self._heartbeat_handle = None
+        self._watchdog_stop.set()
+        self._watchdog_stop = None
+
+    @contextmanager
+    def measure_command(self, command: str) -> Iterator[None]:
+        wall_start: float = time.perf_counter()
+        cpu_start: float = time.thread_time()
+        try:
+            yield
+        finally:
+            wall_time: float = time.perf_counter() - wall_start
+            cpu_time: float = time.thread_time() - cpu_start
+
+            stats: CommandStats = self._commands_stats.setdefault(command, CommandStats())
+            stats.calls = stats.calls + 1
+            stats.wall_time = stats.wall_time + wall_time
+            stats.cpu_time = stats.cpu_time + cpu_time
+            stats.max_wall_time = max(stats.max_wall_time, wall_time)
+
+            if wall_time >= self.slow_command_threshold:
+                logger.warning("Slow command %s: wall %.3f ms, cpu %.3f ms", command, wall_time * 1000,
+                               cpu_time * 1000)
+
+    # Must be called from the event loop thread, samples are taken from another thread
+    def capture(self, duration: float) -> Optional[str]:
+        if self._is_capturing:
+            return None
+
+        self._is_capturing = True
+        path: str = os.path.join(self._profiles_directory, f"profile_{dt.now().strftime('%Y%m%d_%H%M%S')}.txt")
+        sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), duration, path), daemon=True)
+        sampler.start()
+        logger.info("Capture profile for %s seconds to %s", duration, path)
+        return path
+
+    def _beat(self) -> None:
+        interval: float = self._stall_threshold / 2
+        self._expected_beat = time.monotonic() + interval
+        self._heartbeat_handle = asyncio.get_running_loop().call_later(interval, self._beat)
+
+    def _watch_loop(self, stop: threading.Event) -> None:
+        reported_beat: float = 0.0
+        while not stop.wait(self._stall_threshold / 2):
+            expected_beat: float = self._expected_beat
+            # The loop is blocked at least for as long as the heartbeat is late
+            stall: float = time.monotonic() - expected_beat
+            if stall < self._stall_threshold or expected_beat == reported_beat:
+                continue
+
+            frame: Optional[FrameType] = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            reported_beat = expected_beat
+            stack: str = "".join(traceback.format_stack(frame))
+            logger.warning("Event loop is blocked for %.3f s:\n%s", stall, stack)
+
+    def _sample(self, thread_id: int, duration: float, path: str) -> None:
+        stacks: Counter[str] = Counter()
+        end: float = time.monotonic() + duration
+        try:
+            while time.monotonic() < end:
+                frame: Optional[FrameType] = sys._current_frames().get(thread_id)
+                if frame is None:
+                    break
+                stacks[self._collapse_stack(frame)] += 1
+                del frame
+                time.sleep(self._sampling_interval)
+
+            os.makedirs(self._profiles_directory, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, samples in stacks.most_common():
+                    f.write(f"{stack} {samples}\n")
+            logger.info("Profile with %s samples was written to %s", stacks.total(), path)
+        except OSError as error:
+            logger.error("Failed to write profile to %s: %s", path, error)
+        finally:
+            self._is_capturing = False
+
+    # Stack in collapsed format, root first, that flame graph tools accept
+    @staticmethod
+    def _collapse_stack(frame: Optional[FrameType]) -> str:
+        names: list[str] = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        names.reverse()
+        return ";".join(names)
@@ -0,0 +1,167 @@
+import re
+import time
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_COMPACTION_THRESHOLD = 1024
+
+
+def tokenize(text: str) -> set[str]:
+    return {token.casefold() for token in _TOKEN_PATTERN.findall(text)}
+
+
+@dataclass(slots=True)
+class IndexedMessage:
+    sent_at: float
+    author: str
+    text: str
+
+
+@dataclass
+class SearchResult:
+    messages: list[IndexedMessage] = field(default_factory=list)
+    is_cut_off: bool = False  # scan limit was reached, older matches may be missing
+
+
+# Ascending ids of messages containing a term or written by an author. Ids are evicted only from the front.
+# Most terms occur once, so a single id is stored as a plain int and becomes a list on the second occurrence
+class _PostingList:
+    __slots__ = ("_ids", "_head")
+
+    def __init__(self, ids: Iterable[int] = ()) -> None:
+        self._ids: array = array("Q", ids)
+        self._head: int = 0
+
+    def __len__(self) -> int:
+        return len(self._ids) - self._head
+
+    def append(self, message_id: int) -> None:
+        self._ids.append(message_id)
+
+    def pop_front(self) -> None:
+        self._head = self._head + 1
+        if self._head >= _COMPACTION_THRESHOLD and self._head * 2 >= len(self._ids):
+            del self._ids[:self._head]
+            self._head = 0
+
+    def contains(self, message_id: int) -> bool:
+        index: int = bisect_left(self._ids, message_id, self._head)
+        return index < len(self._ids) and self._ids[index] == message_id
+
+    def newest_first(self) -> Iterator[int]:
+        for index in range(len(self._ids) - 1, self._head - 1, -1):
+            yield self._ids[index]
+
+
+class SearchIndex:
+    def __init__(self, max_size: int = 0, ttl: int = 0) -> None:
+        self._max_size: int = max_size
+        self._ttl: int = ttl
+        self._messages: list[IndexedMessage] = []
+        self._head: int = 0
+        self._first_id: int = 0
+        self._terms: dict[str, int | _PostingList] = {}
+        self._authors: dict[str, int | _PostingList] = {}
+
+    def __len__(self) -> int:
+        return len(self._messages) - self._head
+
+    @property
+    def messages(self) -> list[IndexedMessage]:
+        return self._messages[self._head:]
+
+    def add(self, author: str, text: str, sent_at: Optional[float] = None) -> None:
+        if sent_at is None:
+            sent_at = time.time()
+
+        message_id: int = self._first_id + len(self)
+        self._messages.append(IndexedMessage(sent_at, author, text))
+        for term in tokenize(text):
+            self._append(self._terms, term, message_id)
+        self._append(self._authors, author, message_id)
+
+        self._evict()
+
+    # scan_limit bounds the work of one query: at most that many ids of the shortest posting list are checked
+    def search(self, terms: str, author: Optional[str] = None, since: Optional[float] = None,
+               limit: int = 0, scan_limit: int = 0) -> SearchResult:
+        self._evict()
+
+        posting_lists: list[Optional[_PostingList]] = [self._get(self._terms, term) for term in tokenize(terms)]
+        if author is not None:
+            posting_lists.append(self._get(self._authors, author))
+        if len(posting_lists) == 0 or None in posting_lists:
+            return SearchResult()
+
+        posting_lists.sort(key=len)
+        shortest, rest = posting_lists[0], posting_lists[1:]
+
+        result: SearchResult = SearchResult()
+        for scanned, message_id in enumerate(shortest.newest_first()):
+            if 0 < scan_limit == scanned:
+                result.is_cut_off = True
+                break
+
+            message: IndexedMessage = self._messages[self._head + message_id - self._first_id]
+            if since is not None and message.sent_at < since:
+                break
+
+            if all(posting_list.contains(message_id) for posting_list in rest):
+                result.messages.append(message)
+                if 0 < limit == len(result.messages):
+                    break
+
+        result.messages.reverse()
+        return result
+
+    def _evict(self) -> None:
+        expire_before: Optional[float] = None if self._ttl <= 0 else time.time() - self._ttl
+        while len(self) > 0:
+            message: IndexedMessage = self._messages[self._head]
+            is_over_size: bool = 0 < self._max_size < len(self)
+            is_expired: bool = expire_before is not None and message.sent_at < expire_before
+            if not is_over_size and not is_expired:
+                break
+
+            for term in tokenize(message.text):
+                self._pop_front(self._terms, term)
+            self._pop_front(self._authors, message.author)
+
+            self._messages[self._head] = None
+            self._head = self._head + 1
+            self._first_id = self._first_id + 1
+
+        if self._head >= _COMPACTION_THRESHOLD and self._head * 2 >= len(self._messages):
+            del self._messages[:self._head]
+            self._head = 0
+
+    @staticmethod
+    def _get(posting_lists: dict[str, int | _PostingList], key: str) -> Optional[_PostingList]:
+        posting_list: Optional[int | _PostingList] = posting_lists.get(key)
+        if isinstance(posting_list, int):
+            return _PostingList((posting_list,))
+        return posting_list
+
+    @staticmethod
+    def _append(posting_lists: dict[str, int | _PostingList], key: str, message_id: int) -> None:
+        posting_list: Optional[int | _PostingList] = posting_lists.get(key)
+        if posting_list is None:
+            posting_lists[key] = message_id
+        elif isinstance(posting_list, int):
+            posting_lists[key] = _PostingList((posting_list, message_id))
+        else:
+            posting_list.append(message_id)
+
+    @staticmethod
+    def _pop_front(posting_lists: dict[str, int | _PostingList], key: str) -> None:
+        posting_list: int | _PostingList = posting_lists[key]
+        if isinstance(posting_list, int):
+            del posting_lists[key]
+            return
+
+        posting_list.pop_front()
+        if len(posting_list) == 0:
+            del posting_lists[key]
@@ -2,17 +2,35 @@ import asyncio
 import datetime
 import logging
 import argparse
-from threading import Thread
+import hmac
+import os
+import signal
+import socket
+from bisect import bisect_left, insort
 from dataclasses import dataclass
 from datetime import datetime as dt
-from time import sleep
 from typing import Optional, Self, Callable
 
 from settings import Settings
-from utils import CancellationToken, MaxSizeList
+from utils import MaxSizeList, hide_secrets
+from search import IndexedMessage, SearchIndex, SearchResult
+from profiling import Profiler
+from upgrade import (DelayedMessageSnapshot, ServerSnapshot, UserSnapshot, TAKEOVER_ACK, TAKEOVER_COMMIT,
+                     TAKEOVER_REQUEST, encode_search_messages, receive_handoff, receive_search_messages,
+                     send_handoff)
 
 logger = logging.getLogger()
 
+COMMANDS = ["INTRODUCE", "RENAME", "USERS", "SEND", "CANCEL", "HISTORY", "REPORT", "PROFILE", "SEARCH"]
+
+
+@dataclass
+class DelayedMessage:
+    handle: asyncio.TimerHandle
+    message: str
+    recipient_name: Optional[str]
+    send_at: dt
+
 
 @dataclass
 class UserData:
@@ -23,10 +41,11 @@ class UserData:
     user_name: str
     history: MaxSizeList
     reports: list[Self]
-    delayed_messages_tokens: list[CancellationToken]
+    delayed_messages: list[DelayedMessage]
     ban_until: Optional[dt] = None
     spam_period_end: Optional[dt] = None
     messages_in_spam_period: int = 0
+    is_subscribed_to_users: bool = False
 
     def __repr__(self):
         return f"{str(self.peer_name)} -> {self.user_name}"
@@ -51,34 +70,78 @@ class UserData:
         return self.messages_in_spam_period > self.settings.messages_limit_in_spam_period
 
 class Server:
-    def __init__(self, settings: Settings) -> None:
+    def __init__(self, settings: Settings, is_takeover: bool = False) -> None:
         self._users: list[UserData] = []
         self._settings: Settings = settings
-        self._server: Optional[asyncio.Server] = None
+        self._servers: list[asyncio.Server] = []  # one per handed over listener after the takeover
         self._history: MaxSizeList = MaxSizeList(settings.history_size)
+        self._search_index: SearchIndex = SearchIndex(settings.search_index_size, settings.search_ttl)
         self._default_names_counter: int = 1
+        self._user_names: list[str] = []  # sorted
+        self._users_version: int = 0
+        self._users_list_cache: Optional[tuple[int, bytes]] = None
+        self._profiler: Profiler = Profiler(settings.slow_command_threshold, settings.loop_stall_threshold,
+                                            settings.profile_sampling_interval, settings.profiles_directory)
+        self._is_takeover: bool = is_takeover
+        self._is_handing_over: bool = False
+        self._is_handed_over: bool = False
+        self._hand_over_task: Optional[asyncio.Task] = None
+        self._restore_search_index_task: Optional[asyncio.Task] = None
+        self._upgrade_socket: Optional[socket.socket] = None
+        self._is_listening_profiling_signals: bool = False
+        self._restored_users_tasks: set[asyncio.Task] = set()
 
     async def __aenter__(self) -> Self:
-        await self.start()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
         await self.stop()
 
     async def start(self) -> None:
-        logger.info("Start server %s:%s", self._host, self._port)
-        self._server = await asyncio.start_server(self._handle_connection, self._host, self._port)
-        async with self._server:
-            await self._server.serve_forever()
+        if self._is_takeover:
+            await self._take_over()
+        else:
+            logger.info("Start server %s:%s", self._host, self._port)
+            self._servers.append(await asyncio.start_server(self._handle_connection, self._host, self._port))
+
+        self._listen_upgrade_requests()
+        self._listen_profiling_signals()
+        try:
+            # Each server is closed when its serve_forever is cancelled
+            await asyncio.gather(*[server.serve_forever() for server in self._servers])
+        except asyncio.CancelledError:
+            if not self._is_handed_over:
+                raise
+            # Wait until the search index is sent to the new process
+            await self._hand_over_task
 
     async def stop(self) -> None:
-        if self._server is None:
+        self._profiler.disable()
+        if self._is_listening_profiling_signals:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR1)
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR2)
+            self._is_listening_profiling_signals = False
+
+        if self._restore_search_index_task is not None:
+            self._restore_search_index_task.cancel()
+            self._restore_search_index_task = None
+
+        if self._upgrade_socket is not None:
+            asyncio.get_running_loop().remove_reader(self._upgrade_socket.fileno())
+            self._upgrade_socket.close()
+            self._upgrade_socket = None
+            if not self._is_handed_over:
+                os.unlink(self._settings.upgrade_socket_path)
+
+        if len(self._servers) == 0:
             return
 
         logger.info("Stop server %s:%s", self._host, self._port)
-        self._server.close()
-        await self._server.wait_closed()
-        self._server = None
+        for server in self._servers:
+            server.close()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
 
     async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
         peer_name: tuple[str, int] = writer.get_extra_info("peername")
@@ -90,37 +153,276 @@ class Server:
             history.add(history_message)
 
         user: UserData = UserData(self._settings, peer_name, reader, writer, default_user_name, history,
-                                  list[UserData](), list[CancellationToken]())
+                                  list[UserData](), list[DelayedMessage]())
         self._users.append(user)
+        self._add_user_name(user.user_name)
+        if self._is_handing_over:
+            writer.transport.pause_reading()
+
+        await self._serve_user(user)
 
+    async def _serve_user(self, user: UserData) -> None:
         while True:
             try:
-                request_data: bytes = await reader.read(1024)
+                request_data: bytes = await user.reader.read(1024)
+                if self._is_handed_over:
+                    # Unhandled request bytes were handed over too
+                    break
+
                 if request_data == b'':
                     # Connection closed by user
                     break
 
                 request: str = bytes.decode(request_data)
-                logger.info("{%s}: Request: %s", user, request)
+                logger.info("{%s}: Request: %s", user, hide_secrets(request))
 
                 try:
                     self._handle_request(user, request)
                 except:
                     self._send_message(user, "Internal Server Error")
-                    logger.warning("{%s}: Error while handling request: %s", user, request)
+                    logger.warning("{%s}: Error while handling request: %s", user, hide_secrets(request))
 
             except ConnectionError:
                 logger.info("{%s}: Connection error", user)
                 break
 
-        for cancellation_token in user.delayed_messages_tokens:
-            cancellation_token.cancel()
+        if self._is_handed_over:
+            # Connection now belongs to the new server process
+            return
+
+        for delayed_message in user.delayed_messages:
+            delayed_message.handle.cancel()
 
         self._users.remove(user)
+        self._remove_user_name(user.user_name)
         self._send_message_to_all(f"{user.user_name} left the chat")
-        writer.close()
+        user.writer.close()
         logger.info("{%s}: Disconnected", user)
 
+    def _listen_upgrade_requests(self) -> None:
+        path: str = self._settings.upgrade_socket_path
+        if os.path.exists(path):
+            os.unlink(path)
+
+        self._upgrade_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._upgrade_socket.bind(path)
+        self._upgrade_socket.listen(1)
+        self._upgrade_socket.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._upgrade_socket.fileno(), self._handle_upgrade_request)
+        logger.info("Listen upgrade requests on %s", path)
+
+    def _handle_upgrade_request(self) -> None:
+        try:
+            connection, _ = self._upgrade_socket.accept()
+        except BlockingIOError:
+            return
+
+        if self._hand_over_task is not None:
+            logger.warning("Upgrade is already in progress, reject upgrade request")
+            connection.close()
+            return
+
+        self._hand_over_task = asyncio.create_task(self._hand_over(connection))
+
+    async def _hand_over(self, connection: socket.socket) -> None:
+        with connection:
+            try:
+                await self._send_hand_over(connection)
+            except OSError as error:
+                logger.warning("Upgrade failed, keep serving: %s", error)
+                self._is_handing_over = False
+                for user in self._users:
+                    user.writer.transport.resume_reading()
+                self._hand_over_task = None
+                return
+
+            self._finish_hand_over()
+            await self._send_search_index(connection)
+
+    def _finish_hand_over(self) -> None:
+        logger.info("Server was handed over to the new process")
+        self._is_handed_over = True
+        asyncio.get_running_loop().remove_reader(self._upgrade_socket.fileno())
+        self._upgrade_socket.close()
+        self._upgrade_socket = None
+
+        for user in self._users:
+            for delayed_message in user.delayed_messages:
+                delayed_message.handle.cancel()
+            # Both buffers are empty or handed over. Closes only this process' descriptor,
+            # the connection itself stays alive in the new process
+            user.writer.transport.abort()
+
+        for server in self._servers:
+            server.close()
+
+    async def _send_hand_over(self, connection: socket.socket) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        connection.setblocking(False)
+        request: bytes = await asyncio.wait_for(loop.sock_recv(connection, len(TAKEOVER_REQUEST)),
+                                                self._settings.upgrade_timeout)
+        if request != TAKEOVER_REQUEST:
+            raise ConnectionError(f"Unknown upgrade request: {request}")
+
+        self._is_handing_over = True
+        for user in self._users:
+            user.writer.transport.pause_reading()
+        await asyncio.wait_for(self._wait_output_flushed(), self._settings.upgrade_flush_timeout)
+
+        # Till the commit the loop is blocked, so nothing is read, written or accepted after the snapshot
+        connection.setblocking(True)
+        connection.settimeout(self._settings.upgrade_timeout)
+        users: list[UserData] = [user for user in self._users if not user.writer.is_closing()]
+        fds: list[int] = [listener.fileno() for listener in self._listeners]
+        fds.extend(user.writer.get_extra_info("socket").fileno() for user in users)
+        send_handoff(connection, self._make_snapshot(users), fds)
+
+        if connection.recv(len(TAKEOVER_ACK), socket.MSG_WAITALL) != TAKEOVER_ACK:
+            raise ConnectionError("Upgrade was not acknowledged")
+        connection.sendall(TAKEOVER_COMMIT)
+
+    # Index is not a part of the snapshot, it is streamed after the commit and rebuilt by the new process in background
+    async def _send_search_index(self, connection: socket.socket) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        connection.setblocking(False)
+        try:
+            for frame in encode_search_messages(self._search_index.messages):
+                # The new process may stall, the old one has to exit anyway
+                await asyncio.wait_for(loop.sock_sendall(connection, frame), self._settings.upgrade_timeout)
+        except (OSError, asyncio.TimeoutError) as error:
+            logger.warning("Failed to send search index: %r", error)
+            return
+
+        logger.info("Search index with %s messages was sent to the new process", len(self._search_index))
+
+    async def _wait_output_flushed(self) -> None:
+        while any(not user.writer.is_closing() and user.writer.transport.get_write_buffer_size() > 0
+                  for user in self._users):
+            await asyncio.sleep(0.01)
+
+    def _make_snapshot(self, users: list[UserData]) -> ServerSnapshot:
+        snapshot: ServerSnapshot = ServerSnapshot(self._default_names_counter, len(self._listeners),
+                                                  list(self._history.data), users_version=self._users_version)
+        for user in users:
+            snapshot.users.append(UserSnapshot(
+                user.user_name,
+                list(user.history.data),
+                [reporter.user_name for reporter in user.reports],
+                [DelayedMessageSnapshot(e.message, e.recipient_name, e.send_at.timestamp())
+                 for e in user.delayed_messages],
+                None if user.ban_until is None else user.ban_until.timestamp(),
+                None if user.spam_period_end is None else user.spam_period_end.timestamp(),
+                user.messages_in_spam_period,
+                user.is_subscribed_to_users,
+                # Request bytes already read from the socket, but not handled yet
+                bytes(user.reader._buffer)))
+        return snapshot
+
+    async def _take_over(self) -> None:
+        logger.info("Take over server through %s", self._settings.upgrade_socket_path)
+        # Blocking handoff runs in a thread, so it also works when both servers share one event loop
+        snapshot, sockets, connection = await asyncio.to_thread(self._receive_hand_over)
+        await self._restore(snapshot, sockets)
+        self._restore_search_index_task = asyncio.create_task(self._restore_search_index(connection))
+
+        logger.info("Server %s:%s was taken over with %s users", self._host, self._port, len(self._users))
+
+    def _receive_hand_over(self) -> tuple[ServerSnapshot, list[socket.socket], socket.socket]:
+        connection: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sockets: list[socket.socket] = []
+        try:
+            connection.settimeout(self._settings.upgrade_timeout)
+            connection.connect(self._settings.upgrade_socket_path)
+            connection.sendall(TAKEOVER_REQUEST)
+            snapshot, fds = receive_handoff(connection)
+            sockets = [socket.socket(fileno=fd) for fd in fds]
+
+            # Nothing is served and read until the running server commits, otherwise both would serve clients
+            connection.sendall(TAKEOVER_ACK)
+            if connection.recv(len(TAKEOVER_COMMIT), socket.MSG_WAITALL) != TAKEOVER_COMMIT:
+                raise ConnectionError("Upgrade was not committed by the running server")
+        except Exception:
+            for sock in sockets:
+                sock.close()
+            connection.close()
+            raise
+
+        return snapshot, sockets, connection
+
+    async def _restore_search_index(self, connection: socket.socket) -> None:
+        search_index: SearchIndex = SearchIndex(self._settings.search_index_size, self._settings.search_ttl)
+        with connection:
+            connection.setblocking(False)
+            try:
+                async for messages in receive_search_messages(connection):
+                    for message in messages:
+                        search_index.add(message.author, message.text, message.sent_at)
+                    # Let clients be served between frames
+                    await asyncio.sleep(0)
+            except (OSError, ValueError) as error:
+                logger.warning("Search index was not restored: %s", error)
+                return
+
+        # Messages sent after the takeover are newer than all restored ones
+        for message in self._search_index.messages:
+            search_index.add(message.author, message.text, message.sent_at)
+        self._search_index = search_index
+        self._restore_search_index_task = None
+        logger.info("Search index with %s messages was restored", len(search_index))
+
+    async def _restore(self, snapshot: ServerSnapshot, sockets: list[socket.socket]) -> None:
+        for listener in sockets[:snapshot.listeners_amount]:
+            self._servers.append(await asyncio.start_server(self._handle_connection, sock=listener))
+
+        self._default_names_counter = snapshot.default_names_counter
+        self._users_version = snapshot.users_version
+        for history_message in snapshot.history:
+            self._history.add(history_message)
+
+        users_snapshots: dict[str, UserSnapshot] = {}
+        for user_snapshot, client_socket in zip(snapshot.users, sockets[snapshot.listeners_amount:]):
+            user: UserData = await self._restore_user(user_snapshot, client_socket)
+            self._users.append(user)
+            insort(self._user_names, user.user_name)
+            users_snapshots[user.user_name] = user_snapshot
+
+        for user in self._users:
+            user_snapshot: UserSnapshot = users_snapshots[user.user_name]
+            for reporter_name in user_snapshot.reported_by:
+                reporter: Optional[UserData] = self._get_user_by_name(reporter_name)
+                if reporter is not None:
+                    user.reports.append(reporter)
+
+            for delayed_message in user_snapshot.delayed_messages:
+                self._schedule_delayed_message(user, delayed_message.message, delayed_message.recipient_name,
+                                               dt.fromtimestamp(delayed_message.send_at))
+
+            task: asyncio.Task = asyncio.create_task(self._serve_user(user))
+            self._restored_users_tasks.add(task)
+            task.add_done_callback(self._restored_users_tasks.discard)
+
+    async def _restore_user(self, user_snapshot: UserSnapshot, client_socket: socket.socket) -> UserData:
+        reader, writer = await asyncio.open_connection(sock=client_socket)
+        if len(user_snapshot.pending_input) > 0:
+            reader.feed_data(user_snapshot.pending_input)
+        history: MaxSizeList = MaxSizeList(self._settings.history_size)
+        for history_message in user_snapshot.history:
+            history.add(history_message)
+
+        user: UserData = UserData(self._settings, writer.get_extra_info("peername"), reader, writer,
+                                  user_snapshot.user_name, history, list[UserData](), list[DelayedMessage]())
+        if user_snapshot.ban_until is not None:
+            user.ban_until = dt.fromtimestamp(user_snapshot.ban_until)
+        if user_snapshot.spam_period_end is not None:
+            user.spam_period_end = dt.fromtimestamp(user_snapshot.spam_period_end)
+        user.messages_in_spam_period = user_snapshot.messages_in_spam_period
+        user.is_subscribed_to_users = user_snapshot.is_subscribed_to_users
+        return user
+
+    @property
+    def _listeners(self) -> list[socket.socket]:
+        return [listener for server in self._servers for listener in server.sockets]
+
     @property
     def _host(self) -> str:
         return self._settings.host
@@ -156,32 +458,69 @@ class Server:
         match request.split():
             case [command, *tail]:
                 command = command.upper()
-                logger.info("Command %s:%s", command, tail)
-                if command == "INTRODUCE":
-                    user_name = ' '.join(tail)
-                    self._introduce(user, user_name)
-                if command == "RENAME":
-                    user_name = ' '.join(tail)
-                    self._rename(user, user_name)
-                elif command == "USERS":
-                    self._return_users_list(user)
-                elif command == "SEND":
-                    parser = argparse.ArgumentParser()
-
-                    parser.add_argument("-d", "--delay", dest="delay", default=0, type=int)
-                    parser.add_argument("-r", "--recipient", dest="recipient", default=None, type=str)
-
-                    results, rest = parser.parse_known_args(tail)
-                    message = ' '.join(rest)
-
-                    self._send(user, message, delay_in_seconds=results.delay, recipient_name=results.recipient)
-                elif command == "CANCEL":
-                    self._cancel(user)
-                elif command == "HISTORY":
-                    self._show_user_history(user)
-                elif command == "REPORT":
-                    user_name = ' '.join(tail)
-                    self._report(user, user_name)
+                logger.info("Command %s:%s", command, hide_secrets(request).split()[1:])
+                if self._profiler.is_enabled:
+                    # Any word may be sent as a command, stats are kept only for the known ones
+                    with self._profiler.measure_command(command if command in COMMANDS else "UNKNOWN"):
+                        self._handle_command(user, command, tail)
+                else:
+                    self._handle_command(user, command, tail)
+
+    def _handle_command(self, user: UserData, command: str, tail: list[str]) -> None:
+        if command == "INTRODUCE":
+            user_name = ' '.join(tail)
+            self._introduce(user, user_name)
+        if command == "RENAME":
+            user_name = ' '.join(tail)
+            self._rename(user, user_name)
+        elif command == "USERS":
+            self._handle_users_command(user, tail)
+        elif command == "SEND":
+            parser = argparse.ArgumentParser()
+
+            parser.add_argument("-d", "--delay", dest="delay", default=0, type=int)
+            parser.add_argument("-r", "--recipient", dest="recipient", default=None, type=str)
+
+            results, rest = parser.parse_known_args(tail)
+            message = ' '.join(rest)
+
+            self._send(user, message, delay_in_seconds=results.delay, recipient_name=results.recipient)
+        elif command == "CANCEL":
+            self._cancel(user)
+        elif command == "HISTORY":
+            self._show_user_history(user)
+        elif command == "REPORT":
+            user_name = ' '.join(tail)
+            self._report(user, user_name)
+        elif command == "PROFILE":
+            self._profile(user, tail)
+        elif command == "SEARCH":
+            parser = argparse.ArgumentParser()
+
+            parser.add_argument("-u", "--user", dest="user", default=None, type=str)
+            parser.add_argument("--since", dest="since", default=None, type=str)
+
+            results, rest = parser.parse_known_args(tail)
+            terms = ' '.join(rest)
+
+            self._search(user, terms, author_name=results.user, since=results.since)
+
+    def _handle_users_command(self, user: UserData, tail: list[str]) -> None:
+        parser = argparse.ArgumentParser()
+
+        parser.add_argument("-p", "--page", dest="page", default=None, type=int)
+        parser.add_argument("--prefix", dest="prefix", default=None, type=str)
+        parser.add_argument("-s", "--subscribe", dest="subscribe", action="store_true")
+        parser.add_argument("--unsubscribe", dest="unsubscribe", action="store_true")
+
+        results, _ = parser.parse_known_args(tail)
+
+        if results.unsubscribe:
+            self._subscribe_to_users(user, False)
+        else:
+            if results.subscribe:
+                self._subscribe_to_users(user, True)
+            self._return_users_list(user, page=results.page, prefix=results.prefix)
 
     def _introduce(self, sender: UserData, user_name: str) -> None:
         is_name_correct, user_name, error = self._check_name(user_name)
@@ -206,10 +545,59 @@ class Server:
             self._send_message_to_all(f"{sender.user_name} changed name to {user_name}", sender)
             self._send_message(sender, f"Your name was changed to {user_name}")
 
+        self._rename_user_name(sender.user_name, user_name)
         sender.user_name = user_name
 
-    def _return_users_list(self, sender: UserData) -> None:
-        self._send_system_block_message(sender, "USERS", self._users, lambda e: e.user_name)
+    def _return_users_list(self, sender: UserData, page: Optional[int] = None, prefix: Optional[str] = None) -> None:
+        if page is None and prefix is None:
+            if self._users_list_cache is None or self._users_list_cache[0] != self._users_version:
+                message: str = self._make_system_block_message(f"USERS {self._users_version}", self._user_names)
+                self._users_list_cache = (self._users_version, str.encode(message) + b"\n")
+
+            logger.info("{%s}: Send users list, version %s", sender, self._users_version)
+            sender.writer.write(self._users_list_cache[1])
+            return
+
+        start: int = 0
+        end: int = len(self._user_names)
+        if prefix is not None:
+            start = bisect_left(self._user_names, prefix)
+            end = bisect_left(self._user_names, prefix + chr(0x10FFFF), start)
+
+        page_size: int = self._settings.users_page_size
+        pages_amount: int = max(1, (end - start + page_size - 1) // page_size)
+        page = 1 if page is None else page
+        page_start: int = start + (page - 1) * page_size
+        names: list[str] = self._user_names[page_start:min(end, page_start + page_size)] if page > 0 else []
+
+        block_name: str = f"USERS {self._users_version} page {page}/{pages_amount}"
+        self._send_system_block_message(sender, block_name, names)
+
+    def _subscribe_to_users(self, sender: UserData, is_subscribed: bool) -> None:
+        sender.is_subscribed_to_users = is_subscribed
+        if is_subscribed:
+            self._send_message(sender, "You are subscribed to users list changes", show_time=False)
+        else:
+            self._send_message(sender, "You are unsubscribed from users list changes", show_time=False)
+
+    def _add_user_name(self, user_name: str) -> None:
+        insort(self._user_names, user_name)
+        self._notify_users_changed(f"+{user_name}")
+
+    def _remove_user_name(self, user_name: str) -> None:
+        del self._user_names[bisect_left(self._user_names, user_name)]
+        self._notify_users_changed(f"-{user_name}")
+
+    def _rename_user_name(self, old_user_name: str, new_user_name: str) -> None:
+        del self._user_names[bisect_left(self._user_names, old_user_name)]
+        insort(self._user_names, new_user_name)
+        self._notify_users_changed(f"-{old_user_name} +{new_user_name}")
+
+    def _notify_users_changed(self, delta: str) -> None:
+        self._users_version = self._users_version + 1
+        for user in self._users:
+            if user.is_subscribed_to_users:
+                self._send_message(user, f"USERS {self._users_version} {delta}", show_time=False)
 
     def _send(self, sender: UserData, message: str,
               recipient_name: Optional[str] = None, delay_in_seconds: int = 0) -> None:
@@ -219,17 +607,9 @@ class Server:
             return
 
         if delay_in_seconds > 0:
-            def send_async():
-                sleep(delay_in_seconds)
-                sender.delayed_messages_tokens.remove(cancellation_token)
-                if cancellation_token.is_active:
-                    self._send(sender, message, recipient_name)
-
-            cancellation_token = CancellationToken()
-            sender.delayed_messages_tokens.append(cancellation_token)
+            send_at: dt = dt.now() + datetime.timedelta(seconds=delay_in_seconds)
+            self._schedule_delayed_message(sender, message, recipient_name, send_at)
             self._send_message(sender, f"Your message will be send after {delay_in_seconds} seconds")
-            thread = Thread(target=send_async)
-            thread.start()
             return
 
         if message == '' or message is None:
@@ -245,6 +625,7 @@ class Server:
         if recipient_name is None:
             sent_message = self._send_message_to_all(f"{sender.user_name}: {message}", add_to_history=True)
             self._history.add(sent_message)
+            self._search_index.add(sender.user_name, message)
         else:
             recipient = self._get_user_by_name(recipient_name)
             if recipient is None:
@@ -254,18 +635,113 @@ class Server:
                 self._send_message(sender, whisper_message, add_to_history=True)
                 self._send_message(recipient, whisper_message, add_to_history=True)
 
+    def _schedule_delayed_message(self, sender: UserData, message: str, recipient_name: Optional[str],
+                                  send_at: dt) -> None:
+        def send_delayed():
+            sender.delayed_messages.remove(delayed_message)
+            self._send(sender, message, recipient_name)
+
+        delay: float = max(0.0, (send_at - dt.now()).total_seconds())
+        handle: asyncio.TimerHandle = asyncio.get_running_loop().call_later(delay, send_delayed)
+        delayed_message: DelayedMessage = DelayedMessage(handle, message, recipient_name, send_at)
+        sender.delayed_messages.append(delayed_message)
+
     def _cancel(self, sender: UserData) -> None:
-        if len(sender.delayed_messages_tokens) == 0:
+        if len(sender.delayed_messages) == 0:
             self._send_message(sender, "You have no delayed messages")
             return
 
-        cancellation_token = sender.delayed_messages_tokens.pop()
-        cancellation_token.cancel()
+        delayed_message = sender.delayed_messages.pop()
+        delayed_message.handle.cancel()
         self._send_message(sender, "You last delayed message was removed")
 
     def _show_user_history(self, sender: UserData) -> None:
         self._send_system_block_message(sender, "HISTORY", sender.history.data)
 
+    def _search(self, sender: UserData, terms: str, author_name: Optional[str] = None,
+                since: Optional[str] = None) -> None:
+        if terms == "" and author_name is None:
+            self._send_message(sender, "Nothing to search", show_time=False)
+            return
+
+        since_time: Optional[float] = None
+        if since is not None:
+            try:
+                since_time = dt.fromisoformat(since).timestamp()
+            except ValueError:
+                self._send_message(sender, f"Wrong time {since}, use format YYYY-MM-DDTHH:MM:SS", show_time=False)
+                return
+
+        result: SearchResult = self._search_index.search(terms, author_name, since_time,
+                                                         self._settings.search_results_limit,
+                                                         self._settings.search_scan_limit)
+
+        def format_message(message: IndexedMessage) -> str:
+            return f"{self._time_to_str(dt.fromtimestamp(message.sent_at))} {message.author}: {message.text}"
+
+        notes: list[str] = []
+        if self._restore_search_index_task is not None:
+            notes.append("index is being restored, older messages are not found yet")
+        if result.is_cut_off:
+            notes.append("results were cut off, refine the query")
+        block_name: str = "SEARCH" if len(notes) == 0 else f"SEARCH ({'; '.join(notes)})"
+        self._send_system_block_message(sender, block_name, result.messages, format_message)
+
+    def _listen_profiling_signals(self) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, self._toggle_profiling)
+        loop.add_signal_handler(signal.SIGUSR2, self._profiler.capture, self._settings.profile_capture_duration)
+        self._is_listening_profiling_signals = True
+
+    def _toggle_profiling(self) -> None:
+        if self._profiler.is_enabled:
+            self._profiler.disable()
+        else:
+            self._profiler.enable()
+
+    def _profile(self, sender: UserData, arguments: list[str]) -> None:
+        if self._settings.admin_password is None:
+            self._send_message(sender, "Profiling commands are disabled", show_time=False)
+            return
+
+        if len(arguments) == 0 or not hmac.compare_digest(str.encode(arguments[0]),
+                                                          str.encode(self._settings.admin_password)):
+            self._send_message(sender, "Wrong admin password", show_time=False)
+            return
+
+        match arguments[1:]:
+            case ["on"]:
+                self._profiler.enable()
+                self._send_message(sender, "Profiling is enabled", show_time=False)
+            case ["off"]:
+                self._profiler.disable()
+                self._send_message(sender, "Profiling is disabled", show_time=False)
+            case ["stats"]:
+                stats: list[str] = [f"{command}: {stats}" for command, stats in sorted(
+                    self._profiler.commands_stats.items(), key=lambda e: e[1].wall_time, reverse=True)]
+                self._send_system_block_message(sender, "PROFILE", stats)
+            case ["slow", threshold] if threshold.isdigit():
+                self._profiler.slow_command_threshold = int(threshold) / 1000
+                self._send_message(sender, f"Slow command threshold is {threshold} ms", show_time=False)
+            case ["capture", *duration] if len(duration) == 0 or duration[0].isdigit():
+                seconds: int = int(duration[0]) if len(duration) > 0 else self._settings.profile_capture_duration
+                self._capture_profile(sender, seconds)
+            case _:
+                self._send_message(sender, "Usage: PROFILE <password> on|off|stats|slow <ms>|capture [seconds]",
+                                   show_time=False)
+
+    def _capture_profile(self, sender: UserData, seconds: int) -> None:
+        max_seconds: int = self._settings.profile_max_capture_duration
+        if not 0 < seconds <= max_seconds:
+            self._send_message(sender, f"Capture duration must be from 1 to {max_seconds} seconds", show_time=False)
+            return
+
+        path: Optional[str] = self._profiler.capture(seconds)
+        if path is None:
+            self._send_message(sender, "Profile is already being captured", show_time=False)
+        else:
+            self._send_message(sender, f"Profile will be written to {path} in {seconds} seconds", show_time=False)
+
     def _report(self, sender: UserData, user_name: str) -> None:
         user_to_report: Optional[UserData] = self._get_user_by_name(user_name)
 
@@ -300,14 +776,19 @@ class Server:
         if " " in user_name:
             return False, user_name, "Empty spaces are restricted in names"
 
-        for user in self._users:
-            if user.user_name is not None and user.user_name == user_name:
-                return False, user_name, "Already have user with that name"
+        index: int = bisect_left(self._user_names, user_name)
+        if index < len(self._user_names) and self._user_names[index] == user_name:
+            return False, user_name, "Already have user with that name"
 
         return True, user_name, ""
 
     def _send_system_block_message(self, sender: UserData, block_name: str, data: list,
                                    worker: Callable[[object], str] | None = None) -> None:
+        message: str = self._make_system_block_message(block_name, data, worker)
+        self._send_message(sender, message, show_time=False)
+
+    @staticmethod
+    def _make_system_block_message(block_name: str, data: list, worker: Callable[[object], str] | None = None) -> str:
         rows: list[str] = [f"*** {block_name} ***\n"]
         if len(data) == 0:
             rows.append("EMPTY\n")
@@ -318,8 +799,7 @@ class Server:
                 rows.append(element)
                 rows.append("\n")
 
-        message: str = "".join(rows)
-        self._send_message(sender, message, show_time=False)
+        return "".join(rows)
 
     def _get_user_by_name(self, user_name: str) -> Optional[UserData]:
         for user in self._users:
@@ -329,4 +809,4 @@ class Server:
 
     @staticmethod
     def _time_to_str(time: dt) -> str:
-        return f"[{time.strftime("%Y-%m-%d %H:%M:%S")}]"
+        return f"[{time.strftime('%Y-%m-%d %H:%M:%S')}]"
@@ -10,6 +10,9 @@ load_dotenv()
 class Settings:
     host: str = os.getenv("SERVER_HOST")
     port: int = os.getenv("SERVER_PORT")
+    upgrade_socket_path: str = os.getenv("SERVER_UPGRADE_SOCKET", "server.sock")
+    upgrade_timeout: int = 5  # in seconds
+    upgrade_flush_timeout: int = 2  # in seconds
     default_name: str = "Anonymous"
     greeting_message: str = "Welcome to Test Server"
     history_size: int = 20
@@ -17,3 +20,15 @@ class Settings:
     ban_duration: int = 600  # in seconds
     messages_limit_in_spam_period: int = 5
     spam_period: int = 10  # in seconds
+    search_index_size: int = 1000000  # messages, 0 - unlimited
+    search_ttl: int = 0  # in seconds, 0 - unlimited
+    search_results_limit: int = 20
+    search_scan_limit: int = 5000  # message ids checked by one query, 0 - unlimited
+    users_page_size: int = 100
+    admin_password: str | None = os.getenv("SERVER_ADMIN_PASSWORD")
+    slow_command_threshold: float = 0.1  # in seconds
+    loop_stall_threshold: float = 0.5  # in seconds
+    profile_sampling_interval: float = 0.005  # in seconds
+    profile_capture_duration: int = 10  # in seconds
+    profile_max_capture_duration: int = 60  # in seconds
+    profiles_directory: str = "profiles"
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 
 from server import Server
@@ -8,10 +9,15 @@ from log_settings import init_full_logs as init_logging
 if __name__ == "__main__":
     init_logging("server")
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--takeover", action="store_true",
+                        help="take over listening socket, clients and state from the running server")
+    args = parser.parse_args()
+
     settings: Settings = Settings()
 
     async def main():
-        async with Server(settings) as server:
+        async with Server(settings, args.takeover) as server:
             await server.start()
 
     asyncio.run(main())
@@ -0,0 +1,14 @@
+import unittest
+
+from utils import hide_secrets
+
+
+class HideSecretsTestCase(unittest.TestCase):
+    def test_hide_password(self):
+        self.assertEqual("PROFILE *** capture 10", hide_secrets("PROFILE secret capture 10"))
+        self.assertEqual("profile ***", hide_secrets("profile пароль"))
+
+    def test_keep_other_requests(self):
+        self.assertEqual("send -r bob secret", hide_secrets("send -r bob secret"))
+        self.assertEqual("PROFILE", hide_secrets("PROFILE"))
+        self.assertEqual("", hide_secrets(""))
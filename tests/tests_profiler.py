@@ -0,0 +1,70 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from profiling import Profiler
+
+
+class ProfilerTestCase(unittest.TestCase):
+    def test_measure_command(self):
+        profiler: Profiler = Profiler(0.01, 1.0, 0.001, tempfile.gettempdir())
+
+        with self.assertLogs(level="WARNING") as logs:
+            with profiler.measure_command("SEND"):
+                time.sleep(0.02)
+            with profiler.measure_command("SEND"):
+                pass
+
+        self.assertEqual(1, len(logs.output))
+        self.assertIn("Slow command SEND", logs.output[0])
+        stats = profiler.commands_stats["SEND"]
+        self.assertEqual(2, stats.calls)
+        self.assertGreaterEqual(stats.wall_time, 0.02)
+        self.assertGreaterEqual(stats.max_wall_time, 0.02)
+
+    def test_detect_loop_stall(self):
+        profiler: Profiler = Profiler(1.0, 0.05, 0.001, tempfile.gettempdir())
+
+        async def block_loop():
+            profiler.enable()
+            time.sleep(0.2)
+            profiler.disable()
+
+        with self.assertLogs(level="WARNING") as logs:
+            asyncio.run(block_loop())
+
+        self.assertIn("Event loop is blocked", logs.output[0])
+        self.assertIn("block_loop", logs.output[0])
+        self.assertFalse(profiler.is_enabled)
+
+    def test_short_block_is_not_stall(self):
+        profiler: Profiler = Profiler(1.0, 0.4, 0.001, tempfile.gettempdir())
+
+        async def block_loop_before_heartbeat():
+            profiler.enable()
+            await asyncio.sleep(0.19)
+            time.sleep(0.3)
+            await asyncio.sleep(0.3)
+            profiler.disable()
+
+        with self.assertNoLogs(level="WARNING"):
+            asyncio.run(block_loop_before_heartbeat())
+
+    def test_capture(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler: Profiler = Profiler(1.0, 1.0, 0.001, directory)
+
+            def busy_loop():
+                end = time.monotonic() + 0.2
+                while time.monotonic() < end:
+                    pass
+
+            path = profiler.capture(0.1)
+            self.assertIsNone(profiler.capture(0.1))
+            busy_loop()
+
+            self.assertTrue(os.path.exists(path))
+            with open(path, encoding='utf-8') as f:
+                self.assertIn("busy_loop", f.read())
@@ -0,0 +1,87 @@
+import unittest
+
+from search import IndexedMessage, SearchIndex, SearchResult
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    def test_search_by_all_terms(self):
+        index: SearchIndex = SearchIndex()
+        index.add("alice", "Hello world", 1.0)
+        index.add("bob", "hello there", 2.0)
+        index.add("alice", "World peace", 3.0)
+
+        self.assertEqual(["Hello world", "hello there"], [e.text for e in index.search("HELLO").messages])
+        self.assertEqual(["Hello world"], [e.text for e in index.search("world hello").messages])
+        self.assertEqual([], index.search("hello unknown").messages)
+        self.assertEqual([], index.search("").messages)
+
+    def test_search_by_author(self):
+        index: SearchIndex = SearchIndex()
+        index.add("alice", "hello world", 1.0)
+        index.add("bob", "hello there", 2.0)
+        index.add("alice", "world peace", 3.0)
+
+        self.assertEqual([IndexedMessage(2.0, "bob", "hello there")], index.search("hello", "bob").messages)
+        self.assertEqual(["hello world", "world peace"], [e.text for e in index.search("", "alice").messages])
+        self.assertEqual([], index.search("hello", "carol").messages)
+
+    def test_search_since(self):
+        index: SearchIndex = SearchIndex()
+        for i in range(10):
+            index.add("alice", f"message {i}", float(i))
+
+        self.assertEqual(["message 8", "message 9"], [e.text for e in index.search("message", since=8.0).messages])
+
+    def test_search_limit_returns_newest(self):
+        index: SearchIndex = SearchIndex()
+        for i in range(10):
+            index.add("alice", f"message {i}", float(i))
+
+        self.assertEqual(["message 7", "message 8", "message 9"],
+                         [e.text for e in index.search("message", limit=3).messages])
+
+    def test_evict_by_size(self):
+        index: SearchIndex = SearchIndex(max_size=3)
+        for i in range(5000):
+            index.add(f"user_{i % 2}", f"message number{i}", float(i))
+
+        self.assertEqual(3, len(index))
+        self.assertEqual([], index.search("number4996").messages)
+        self.assertEqual(["message number4998"], [e.text for e in index.search("number4998").messages])
+        self.assertEqual(["message number4998"], [e.text for e in index.search("message", "user_0").messages])
+        self.assertEqual(["message number4997", "message number4998", "message number4999"],
+                         [e.text for e in index.messages])
+
+    def test_evict_by_ttl(self):
+        index: SearchIndex = SearchIndex(ttl=60)
+        index.add("alice", "old message", 1.0)
+        index.add("alice", "new message")
+
+        self.assertEqual(["new message"], [e.text for e in index.search("message").messages])
+        self.assertEqual(1, len(index))
+
+    def test_scan_limit_for_common_terms_without_intersection(self):
+        index: SearchIndex = SearchIndex()
+        for i in range(10000):
+            index.add("alice", f"foo{i % 2} bar{i % 2}", float(i))
+
+        self.assertEqual(SearchResult([], True), index.search("foo0 bar1", scan_limit=100))
+        self.assertEqual(SearchResult([], False), index.search("foo0 bar1"))
+
+        result: SearchResult = index.search("foo0 bar0", limit=3, scan_limit=100)
+        self.assertFalse(result.is_cut_off)
+        self.assertEqual(["foo0 bar0"] * 3, [e.text for e in result.messages])
+        self.assertTrue(index.search("foo1", "alice", since=9000.0, scan_limit=100).is_cut_off)
+
+    def test_term_occurring_once_and_more(self):
+        index: SearchIndex = SearchIndex(max_size=2)
+        index.add("alice", "unique common", 1.0)
+        index.add("bob", "common", 2.0)
+
+        self.assertEqual(["unique common"], [e.text for e in index.search("unique").messages])
+        self.assertEqual(["unique common", "common"], [e.text for e in index.search("common").messages])
+
+        index.add("bob", "other", 3.0)
+        self.assertEqual([], index.search("unique").messages)
+        self.assertEqual(["common"], [e.text for e in index.search("common").messages])
+        self.assertEqual([], index.search("", "alice").messages)
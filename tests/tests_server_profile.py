@@ -0,0 +1,116 @@
+import asyncio
+import os
+import socket
+import tempfile
+import time
+import unittest
+from typing import Optional
+
+from server import Server
+from settings import Settings
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerProfileTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._server: Optional[Server] = None
+        self._server_task: Optional[asyncio.Task] = None
+        self._writers: list[asyncio.StreamWriter] = []
+
+    async def asyncTearDown(self):
+        for writer in self._writers:
+            writer.close()
+        if self._server is not None:
+            self._server_task.cancel()
+            await asyncio.gather(self._server_task, return_exceptions=True)
+            await self._server.stop()
+        self._directory.cleanup()
+
+    async def _start_server(self, admin_password: Optional[str]) -> None:
+        self._settings = Settings(host="127.0.0.1", port=get_free_port(),
+                                  upgrade_socket_path=os.path.join(self._directory.name, "server.sock"),
+                                  admin_password=admin_password, profile_max_capture_duration=5,
+                                  profiles_directory=os.path.join(self._directory.name, "profiles"))
+        self._server = Server(self._settings)
+        self._server_task = asyncio.create_task(self._server.start())
+        while not os.path.exists(self._settings.upgrade_socket_path):
+            await asyncio.sleep(0.01)
+
+    async def _connect(self, user_name: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self._settings.host, self._settings.port)
+        self._writers.append(writer)
+        await self._request(reader, writer, f"introduce {user_name}", self._settings.greeting_message)
+        return reader, writer
+
+    async def _request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: str,
+                       expected: str) -> str:
+        writer.write(str.encode(request))
+        await writer.drain()
+        return await self._read_until(reader, expected)
+
+    @staticmethod
+    async def _read_until(reader: asyncio.StreamReader, expected: str) -> str:
+        response: str = ""
+        while expected not in response:
+            response = response + bytes.decode(await asyncio.wait_for(reader.readline(), 5))
+        return response
+
+    async def test_disabled_without_admin_password(self):
+        await self._start_server(None)
+        reader, writer = await self._connect("alice")
+
+        await self._request(reader, writer, "profile secret on", "Profiling commands are disabled")
+        self.assertFalse(self._server._profiler.is_enabled)
+
+    async def test_wrong_password(self):
+        await self._start_server("secret")
+        reader, writer = await self._connect("alice")
+
+        with self.assertLogs(level="INFO") as logs:
+            await self._request(reader, writer, "profile wrong on", "Wrong admin password")
+            await self._request(reader, writer, "profile пароль on", "Wrong admin password")
+            await self._request(reader, writer, "profile", "Wrong admin password")
+        self.assertFalse(self._server._profiler.is_enabled)
+        self.assertNotIn("wrong", "".join(logs.output))
+        self.assertNotIn("пароль", "".join(logs.output))
+
+    async def test_on_stats_off(self):
+        await self._start_server("secret")
+        reader, writer = await self._connect("alice")
+
+        await self._request(reader, writer, "profile secret on", "Profiling is enabled")
+        self.assertTrue(self._server._profiler.is_enabled)
+        await self._request(reader, writer, "send hello", "alice: hello")
+        for request in ["junk1", "junk2"]:
+            # There is no response to unknown commands, so let the request be read separately
+            writer.write(str.encode(request))
+            await asyncio.sleep(0.1)
+
+        stats: str = await self._request(reader, writer, "profile secret stats", "*** PROFILE ***")
+        stats = stats + await self._read_until(reader, "UNKNOWN")
+        self.assertIn("SEND: calls 1", stats)
+        self.assertIn("UNKNOWN: calls 2", stats)
+        self.assertEqual(set(), {"JUNK1", "JUNK2"} & set(self._server._profiler.commands_stats))
+
+        await self._request(reader, writer, "profile secret off", "Profiling is disabled")
+        self.assertFalse(self._server._profiler.is_enabled)
+
+    async def test_capture_duration_is_limited(self):
+        await self._start_server("secret")
+        reader, writer = await self._connect("alice")
+
+        await self._request(reader, writer, "profile secret capture 6", "Capture duration must be from 1 to 5 seconds")
+        await self._request(reader, writer, "profile secret capture 0", "Capture duration must be from 1 to 5 seconds")
+        await self._request(reader, writer, "profile secret capture 1", "in 1 seconds")
+        await self._request(reader, writer, "profile secret capture 1", "Profile is already being captured")
+
+        deadline: float = time.monotonic() + 5
+        while self._server._profiler._is_capturing and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self.assertEqual(1, len(os.listdir(self._settings.profiles_directory)))
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from typing import Optional
+
+from server import Server
+from settings import Settings
+from upgrade import TAKEOVER_ACK, TAKEOVER_COMMIT, TAKEOVER_REQUEST, receive_handoff
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerUpgradeTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._settings = Settings(host="127.0.0.1", port=get_free_port(),
+                                  upgrade_socket_path=os.path.join(self._directory.name, "server.sock"),
+                                  upgrade_timeout=2, upgrade_flush_timeout=1)
+        self._servers: list[tuple[Server, asyncio.Task]] = []
+        self._writers: list[asyncio.StreamWriter] = []
+
+    async def asyncTearDown(self):
+        for writer in self._writers:
+            writer.close()
+        for server, task in reversed(self._servers):
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await server.stop()
+        self._directory.cleanup()
+
+    async def _start_server(self, is_takeover: bool = False) -> tuple[Server, asyncio.Task]:
+        server: Server = Server(self._settings, is_takeover)
+        task: asyncio.Task = asyncio.create_task(server.start())
+        self._servers.append((server, task))
+        if not is_takeover:
+            while not os.path.exists(self._settings.upgrade_socket_path):
+                await asyncio.sleep(0.01)
+        return server, task
+
+    async def _connect(self, user_name: str,
+                       host: Optional[str] = None) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(host or self._settings.host, self._settings.port)
+        self._writers.append(writer)
+        await self._request(reader, writer, f"introduce {user_name}", self._settings.greeting_message)
+        return reader, writer
+
+    async def _request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: str,
+                       expected: str) -> str:
+        writer.write(str.encode(request))
+        await writer.drain()
+        return await self._read_until(reader, expected)
+
+    @staticmethod
+    async def _read_until(reader: asyncio.StreamReader, expected: str) -> str:
+        response: str = ""
+        while expected not in response:
+            response = response + bytes.decode(await asyncio.wait_for(reader.readline(), 5))
+        return response
+
+    async def test_clients_keep_connection_and_state(self):
+        _, old_task = await self._start_server()
+        alice_reader, alice_writer = await self._connect("alice")
+        bob_reader, bob_writer = await self._connect("bob")
+
+        await self._request(bob_reader, bob_writer, "report alice", "Reports count: 1")
+        await self._request(alice_reader, alice_writer, "send hello world", "alice: hello world")
+        await self._request(alice_reader, alice_writer, "send -d 1 -r bob delayed", "will be send after 1 seconds")
+
+        await self._start_server(is_takeover=True)
+        await asyncio.wait_for(old_task, 5)
+
+        users: str = await self._request(alice_reader, alice_writer, "users", "*** USERS")
+        users = users + await self._read_until(alice_reader, "bob")
+        self.assertIn("alice", users)
+
+        await self._read_until(bob_reader, "alice->bob: delayed")
+        await self._read_until(alice_reader, "alice->bob: delayed")
+        await self._request(bob_reader, bob_writer, "report alice", "alice was already reported by you")
+        history: str = await self._request(alice_reader, alice_writer, "history", "*** HISTORY")
+        history = history + await self._read_until(alice_reader, "delayed")
+        self.assertIn("alice: hello world", history)
+
+        await self._connect("carol")
+        await self._read_until(alice_reader, "carol joined chat")
+
+    async def test_keep_all_listeners(self):
+        self._settings.host = ["127.0.0.1", "127.0.0.2"]
+        old_server, old_task = await self._start_server()
+        self.assertEqual(2, len(old_server._listeners))
+
+        new_server, _ = await self._start_server(is_takeover=True)
+        await asyncio.wait_for(old_task, 5)
+        deadline: float = time.monotonic() + 5
+        while len(new_server._listeners) < 2 and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(2, len(new_server._listeners))
+        alice_reader, _ = await self._connect("alice", "127.0.0.1")
+        await self._connect("bob", "127.0.0.2")
+        await self._read_until(alice_reader, "bob joined chat")
+
+        await new_server.stop()
+        self.assertEqual([], new_server._listeners)
+        with self.assertRaises(ConnectionError):
+            await asyncio.open_connection("127.0.0.2", self._settings.port)
+
+    async def test_keep_serving_when_upgrade_is_not_committed(self):
+        _, old_task = await self._start_server()
+        alice_reader, alice_writer = await self._connect("alice")
+
+        def request_hand_over_and_quit() -> list[str]:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.connect(self._settings.upgrade_socket_path)
+                connection.sendall(b"TAKEOVER")
+                snapshot, fds = receive_handoff(connection)
+                for fd in fds:
+                    os.close(fd)
+                return [user.user_name for user in snapshot.users]
+
+        self.assertEqual(["alice"], await asyncio.to_thread(request_hand_over_and_quit))
+
+        await self._request(alice_reader, alice_writer, "send still here", "alice: still here")
+        self.assertFalse(old_task.done())
+
+    async def test_old_server_exits_when_search_index_is_not_read(self):
+        old_server, old_task = await self._start_server()
+        await self._connect("alice")
+        for i in range(50000):
+            old_server._search_index.add("bob", f"indexed message{i}", time.time())
+
+        is_done: threading.Event = threading.Event()
+
+        def take_over_and_stall() -> None:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.connect(self._settings.upgrade_socket_path)
+                connection.sendall(TAKEOVER_REQUEST)
+                _, fds = receive_handoff(connection)
+                for fd in fds:
+                    os.close(fd)
+                connection.sendall(TAKEOVER_ACK)
+                self.assertEqual(TAKEOVER_COMMIT, connection.recv(len(TAKEOVER_COMMIT), socket.MSG_WAITALL))
+                is_done.wait(10)
+
+        stalled = asyncio.create_task(asyncio.to_thread(take_over_and_stall))
+        try:
+            with self.assertLogs(level="WARNING") as logs:
+                await asyncio.wait_for(old_task, self._settings.upgrade_timeout + 3)
+            self.assertIn("Failed to send search index", "".join(logs.output))
+        finally:
+            is_done.set()
+            await stalled
+
+    async def test_request_sent_during_upgrade_is_handled_once(self):
+        _, old_task = await self._start_server()
+        alice_reader, alice_writer = await self._connect("alice")
+
+        await self._start_server(is_takeover=True)
+        alice_writer.write(b"send during upgrade")
+        await alice_writer.drain()
+        await asyncio.wait_for(old_task, 5)
+
+        await self._read_until(alice_reader, "alice: during upgrade")
+        history: str = await self._request(alice_reader, alice_writer, "history", "*** HISTORY")
+        history = history + await self._read_until(alice_reader, "during upgrade")
+        self.assertEqual(1, history.count("during upgrade"))
+
+    async def test_upgrade_with_large_search_index(self):
+        old_server, old_task = await self._start_server()
+        alice_reader, alice_writer = await self._connect("alice")
+        for i in range(50000):
+            old_server._search_index.add("bob", f"indexed message{i}", time.time())
+
+        started_at: float = time.monotonic()
+        await self._start_server(is_takeover=True)
+        while not old_server._is_handed_over and time.monotonic() - started_at < 5:
+            await asyncio.sleep(0.01)
+        self.assertLess(time.monotonic() - started_at, 1)
+
+        await self._request(alice_reader, alice_writer, "send after upgrade", "alice: after upgrade")
+
+        async def search(terms: str) -> str:
+            response: str = await self._request(alice_reader, alice_writer, f"search {terms}", "*** SEARCH")
+            return response + bytes.decode(await asyncio.wait_for(alice_reader.readline(), 5))
+
+        response: str = await search("message0")
+        self.assertIn("*** SEARCH (index is being restored", response)
+        self.assertIn("EMPTY", response)
+
+        deadline: float = time.monotonic() + 30
+        while "index is being restored" in response and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            response = await search("message0")
+
+        self.assertIn("*** SEARCH ***", response)
+        self.assertIn("bob: indexed message0", response)
+        self.assertIn("alice: after upgrade", await search("after upgrade"))
+        await asyncio.wait_for(old_task, 5)
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+
+from server import Server
+from settings import Settings
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerUsersTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._settings = Settings(host="127.0.0.1", port=get_free_port(),
+                                  upgrade_socket_path=os.path.join(self._directory.name, "server.sock"),
+                                  users_page_size=2)
+        self._server = Server(self._settings)
+        self._server_task = asyncio.create_task(self._server.start())
+        while not os.path.exists(self._settings.upgrade_socket_path):
+            await asyncio.sleep(0.01)
+        self._writers: list[asyncio.StreamWriter] = []
+
+    async def asyncTearDown(self):
+        for writer in self._writers:
+            writer.close()
+        self._server_task.cancel()
+        await asyncio.gather(self._server_task, return_exceptions=True)
+        await self._server.stop()
+        self._directory.cleanup()
+
+    async def _connect(self, user_name: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self._settings.host, self._settings.port)
+        self._writers.append(writer)
+        await self._request(reader, writer, f"introduce {user_name}", self._settings.greeting_message)
+        return reader, writer
+
+    async def _request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: str,
+                       expected: str) -> str:
+        writer.write(str.encode(request))
+        await writer.drain()
+        return await self._read_until(reader, expected)
+
+    @staticmethod
+    async def _read_until(reader: asyncio.StreamReader, expected: str) -> str:
+        response: str = ""
+        while expected not in response:
+            response = response + bytes.decode(await asyncio.wait_for(reader.readline(), 5))
+        return response
+
+    async def _users(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     request: str = "users") -> list[str]:
+        writer.write(str.encode(request))
+        await writer.drain()
+        return await self._read_block(reader)
+
+    # Rows of the next system block, pushed messages before it are skipped. Block is ended by an empty line
+    @staticmethod
+    async def _read_block(reader: asyncio.StreamReader) -> list[str]:
+        rows: list[str] = []
+        while len(rows) == 0 or rows[-1] != "":
+            row: str = bytes.decode(await asyncio.wait_for(reader.readline(), 5)).rstrip("\n")
+            if len(rows) > 0 or row.startswith("*** "):
+                rows.append(row)
+        return rows[:-1]
+
+    async def test_users_list_cache(self):
+        alice_reader, alice_writer = await self._connect("alice")
+        bob_reader, bob_writer = await self._connect("bob")
+
+        self.assertEqual(["*** USERS 4 ***", "alice", "bob"], await self._users(alice_reader, alice_writer))
+        cached: bytes = self._server._users_list_cache[1]
+        self.assertEqual(["*** USERS 4 ***", "alice", "bob"], await self._users(bob_reader, bob_writer))
+        self.assertIs(cached, self._server._users_list_cache[1])
+
+        carol_reader, carol_writer = await self._connect("carol")
+        self.assertEqual(["*** USERS 6 ***", "alice", "bob", "carol"], await self._users(alice_reader, alice_writer))
+        self.assertIsNot(cached, self._server._users_list_cache[1])
+
+        await self._request(carol_reader, carol_writer, "rename dave", "Your name was changed to dave")
+        self.assertEqual(["*** USERS 7 ***", "alice", "bob", "dave"], await self._users(alice_reader, alice_writer))
+
+        bob_writer.close()
+        await self._read_until(alice_reader, "bob left the chat")
+        self.assertEqual(["*** USERS 8 ***", "alice", "dave"], await self._users(alice_reader, alice_writer))
+
+    async def test_users_pages_and_prefix(self):
+        reader, writer = await self._connect("alice")
+        await self._connect("bob")
+        await self._connect("anna")
+
+        self.assertEqual(["*** USERS 6 page 1/2 ***", "alice", "anna"], await self._users(reader, writer, "users -p 1"))
+        self.assertEqual(["*** USERS 6 page 2/2 ***", "bob"], await self._users(reader, writer, "users --page 2"))
+        self.assertEqual(["*** USERS 6 page 3/2 ***", "EMPTY"], await self._users(reader, writer, "users -p 3"))
+        self.assertEqual(["*** USERS 6 page 0/2 ***", "EMPTY"], await self._users(reader, writer, "users -p 0"))
+        self.assertEqual(["*** USERS 6 page 1/1 ***", "alice", "anna"],
+                         await self._users(reader, writer, "users --prefix a"))
+        self.assertEqual(["*** USERS 6 page 1/1 ***", "anna"], await self._users(reader, writer, "users --prefix an"))
+        self.assertEqual(["*** USERS 6 page 1/1 ***", "EMPTY"], await self._users(reader, writer, "users --prefix c"))
+
+    async def test_users_subscription_deltas(self):
+        alice_reader, alice_writer = await self._connect("alice")
+        await self._request(alice_reader, alice_writer, "users --subscribe", "You are subscribed")
+        self.assertEqual(["*** USERS 2 ***", "alice"], await self._read_block(alice_reader))
+
+        bob_reader, bob_writer = await self._connect("bob")
+        await self._read_until(alice_reader, "USERS 3 +Anonymous_2")
+        await self._read_until(alice_reader, "USERS 4 -Anonymous_2 +bob")
+
+        await self._request(bob_reader, bob_writer, "rename carol", "Your name was changed to carol")
+        await self._read_until(alice_reader, "USERS 5 -bob +carol")
+
+        bob_writer.close()
+        await self._read_until(alice_reader, "USERS 6 -carol")
+
+        await self._request(alice_reader, alice_writer, "users --unsubscribe", "You are unsubscribed")
+        await self._connect("dave")
+        response: str = await self._read_until(alice_reader, "dave joined chat")
+        self.assertNotIn("USERS 7", response)
+
+    async def test_names_must_be_unique(self):
+        await self._connect("alice")
+        reader, writer = await self._connect("bob")
+
+        await self._request(reader, writer, "rename alice", "Already have user with that name")
+        await self._request(reader, writer, "rename Alice", "Your name was changed to Alice")
+        self.assertEqual(["*** USERS 5 ***", "Alice", "alice"], await self._users(reader, writer))
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import socket
+import unittest
+
+from search import IndexedMessage
+from upgrade import (DelayedMessageSnapshot, ServerSnapshot, UserSnapshot, encode_search_messages, receive_handoff,
+                     receive_search_messages, send_handoff)
+
+
+class UpgradeTestCase(unittest.TestCase):
+    @staticmethod
+    def _make_snapshot() -> ServerSnapshot:
+        snapshot: ServerSnapshot = ServerSnapshot(7, 1, ["[2024-01-01 10:00:00] alice: привет"],
+                                                  users_version=12)
+        snapshot.users.append(UserSnapshot("alice", ["message"], ["bob"],
+                                           [DelayedMessageSnapshot("later", None, 1700000000.5),
+                                            DelayedMessageSnapshot("secret", "bob", 1700000001.0)],
+                                           ban_until=1700000100.0, messages_in_spam_period=3))
+        snapshot.users.append(UserSnapshot("bob", spam_period_end=1700000002.25, is_subscribed_to_users=True,
+                                           pending_input=b"send unhandled"))
+        return snapshot
+
+    def test_snapshot_round_trip(self):
+        snapshot: ServerSnapshot = self._make_snapshot()
+
+        self.assertEqual(snapshot, ServerSnapshot.from_bytes(snapshot.to_bytes()))
+
+    def test_empty_snapshot_round_trip(self):
+        snapshot: ServerSnapshot = ServerSnapshot(1, 1)
+
+        self.assertEqual(snapshot, ServerSnapshot.from_bytes(snapshot.to_bytes()))
+
+    def test_handoff_transfers_snapshot_and_descriptors(self):
+        snapshot: ServerSnapshot = self._make_snapshot()
+        pipes: list[tuple[int, int]] = [os.pipe() for _ in range(300)]
+
+        sender, receiver = socket.socketpair()
+        with sender, receiver:
+            send_handoff(sender, snapshot, [read_fd for read_fd, _ in pipes])
+            received_snapshot, fds = receive_handoff(receiver)
+
+        self.assertEqual(snapshot, received_snapshot)
+        self.assertEqual(len(pipes), len(fds))
+
+        for (read_fd, write_fd), received_fd in zip(pipes, fds):
+            os.write(write_fd, b"x")
+            self.assertEqual(b"x", os.read(received_fd, 1))
+            for fd in (read_fd, write_fd, received_fd):
+                os.close(fd)
+
+    def test_search_messages_stream(self):
+        messages: list[IndexedMessage] = [IndexedMessage(float(i), f"user_{i % 3}", f"сообщение {i}")
+                                          for i in range(1234)]
+
+        async def transfer() -> list[list[IndexedMessage]]:
+            loop = asyncio.get_running_loop()
+            sender, receiver = socket.socketpair()
+            with sender, receiver:
+                sender.setblocking(False)
+                receiver.setblocking(False)
+
+                async def send():
+                    for frame in encode_search_messages(messages):
+                        await loop.sock_sendall(sender, frame)
+
+                sending = asyncio.create_task(send())
+                frames = [frame async for frame in receive_search_messages(receiver)]
+                await sending
+                return frames
+
+        frames: list[list[IndexedMessage]] = asyncio.run(transfer())
+
+        self.assertEqual(3, len(frames))
+        self.assertEqual(messages, [message for frame in frames for message in frame])
+
+    def test_empty_search_messages_stream(self):
+        self.assertEqual([b"\x00\x00\x00\x00"], list(encode_search_messages([])))
@@ -0,0 +1,231 @@
+import asyncio
+import socket
+import struct
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator, Optional, Self
+
+from search import IndexedMessage
+
+SNAPSHOT_VERSION = 5
+MAX_FDS_PER_MESSAGE = 250  # SCM_RIGHTS allows at most 253 descriptors in one message
+SEARCH_MESSAGES_PER_FRAME = 500
+TAKEOVER_REQUEST = b"TAKEOVER"
+TAKEOVER_ACK = b"OK"
+TAKEOVER_COMMIT = b"GO"
+
+_HEADER = struct.Struct("!BQI")  # snapshot version, snapshot length, descriptors amount
+_U32 = struct.Struct("!I")
+_F64 = struct.Struct("!d")
+_NONE_TIME = -1.0
+
+
+@dataclass
+class DelayedMessageSnapshot:
+    message: str
+    recipient_name: Optional[str]
+    send_at: float
+
+
+@dataclass
+class UserSnapshot:
+    user_name: str
+    history: list[str] = field(default_factory=list)
+    reported_by: list[str] = field(default_factory=list)
+    delayed_messages: list[DelayedMessageSnapshot] = field(default_factory=list)
+    ban_until: Optional[float] = None
+    spam_period_end: Optional[float] = None
+    messages_in_spam_period: int = 0
+    is_subscribed_to_users: bool = False
+    pending_input: bytes = b""
+
+
+@dataclass
+class ServerSnapshot:
+    default_names_counter: int
+    listeners_amount: int
+    history: list[str] = field(default_factory=list)
+    users: list[UserSnapshot] = field(default_factory=list)
+    users_version: int = 0
+
+    def to_bytes(self) -> bytes:
+        writer: _Writer = _Writer()
+        writer.u32(self.default_names_counter)
+        writer.u32(self.listeners_amount)
+        writer.u32(self.users_version)
+        writer.strings(self.history)
+        writer.u32(len(self.users))
+        for user in self.users:
+            writer.string(user.user_name)
+            writer.strings(user.history)
+            writer.strings(user.reported_by)
+            writer.u32(len(user.delayed_messages))
+            for delayed_message in user.delayed_messages:
+                writer.string(delayed_message.message)
+                writer.optional_string(delayed_message.recipient_name)
+                writer.time(delayed_message.send_at)
+            writer.time(user.ban_until)
+            writer.time(user.spam_period_end)
+            writer.u32(user.messages_in_spam_period)
+            writer.flag(user.is_subscribed_to_users)
+            writer.blob(user.pending_input)
+        return writer.data
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Self:
+        reader: _Reader = _Reader(data)
+        snapshot: Self = cls(reader.u32(), reader.u32())
+        snapshot.users_version = reader.u32()
+        snapshot.history = reader.strings()
+        for _ in range(reader.u32()):
+            user: UserSnapshot = UserSnapshot(reader.string(), reader.strings(), reader.strings())
+            for _ in range(reader.u32()):
+                user.delayed_messages.append(
+                    DelayedMessageSnapshot(reader.string(), reader.optional_string(), reader.time()))
+            user.ban_until = reader.time()
+            user.spam_period_end = reader.time()
+            user.messages_in_spam_period = reader.u32()
+            user.is_subscribed_to_users = reader.flag()
+            user.pending_input = reader.blob()
+            snapshot.users.append(user)
+        return snapshot
+
+
+def send_handoff(sock: socket.socket, snapshot: ServerSnapshot, fds: list[int]) -> None:
+    data: bytes = snapshot.to_bytes()
+    sock.sendall(_HEADER.pack(SNAPSHOT_VERSION, len(data), len(fds)) + data)
+    for i in range(0, len(fds), MAX_FDS_PER_MESSAGE):
+        socket.send_fds(sock, [b"F"], fds[i:i + MAX_FDS_PER_MESSAGE])
+
+
+def receive_handoff(sock: socket.socket) -> tuple[ServerSnapshot, list[int]]:
+    version, data_length, fds_amount = _HEADER.unpack(_receive_exactly(sock, _HEADER.size))
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+
+    snapshot: ServerSnapshot = ServerSnapshot.from_bytes(_receive_exactly(sock, data_length))
+    fds: list[int] = []
+    while len(fds) < fds_amount:
+        _, received_fds, _, _ = socket.recv_fds(sock, 1, min(MAX_FDS_PER_MESSAGE, fds_amount - len(fds)))
+        if len(received_fds) == 0:
+            raise ConnectionError("Handoff connection closed before all descriptors were received")
+        fds.extend(received_fds)
+    return snapshot, fds
+
+
+# Frames of search messages, terminated by an empty frame
+def encode_search_messages(messages: list[IndexedMessage]) -> Iterator[bytes]:
+    for i in range(0, len(messages), SEARCH_MESSAGES_PER_FRAME):
+        writer: _Writer = _Writer()
+        frame_messages: list[IndexedMessage] = messages[i:i + SEARCH_MESSAGES_PER_FRAME]
+        writer.u32(len(frame_messages))
+        for message in frame_messages:
+            writer.time(message.sent_at)
+            writer.string(message.author)
+            writer.string(message.text)
+        data: bytes = writer.data
+        yield _U32.pack(len(data)) + data
+    yield _U32.pack(0)
+
+
+async def receive_search_messages(sock: socket.socket) -> AsyncIterator[list[IndexedMessage]]:
+    while True:
+        length, = _U32.unpack(await _receive_exactly_async(sock, _U32.size))
+        if length == 0:
+            return
+
+        reader: _Reader = _Reader(await _receive_exactly_async(sock, length))
+        yield [IndexedMessage(reader.time(), reader.string(), reader.string()) for _ in range(reader.u32())]
+
+
+async def _receive_exactly_async(sock: socket.socket, size: int) -> bytes:
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    chunks: list[bytes] = []
+    while size > 0:
+        chunk: bytes = await loop.sock_recv(sock, min(size, 1 << 20))
+        if chunk == b'':
+            raise ConnectionError("Connection closed before search messages were received")
+        chunks.append(chunk)
+        size = size - len(chunk)
+    return b"".join(chunks)
+
+
+def _receive_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks: list[bytes] = []
+    while size > 0:
+        chunk: bytes = sock.recv(min(size, 1 << 20))
+        if chunk == b'':
+            raise ConnectionError("Handoff connection closed before snapshot was received")
+        chunks.append(chunk)
+        size = size - len(chunk)
+    return b"".join(chunks)
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    @property
+    def data(self) -> bytes:
+        return b"".join(self._chunks)
+
+    def u32(self, value: int) -> None:
+        self._chunks.append(_U32.pack(value))
+
+    def time(self, value: Optional[float]) -> None:
+        self._chunks.append(_F64.pack(_NONE_TIME if value is None else value))
+
+    def blob(self, value: bytes) -> None:
+        self._chunks.append(_U32.pack(len(value)))
+        self._chunks.append(value)
+
+    def string(self, value: str) -> None:
+        self.blob(str.encode(value))
+
+    def flag(self, value: bool) -> None:
+        self._chunks.append(b"\x01" if value else b"\x00")
+
+    def optional_string(self, value: Optional[str]) -> None:
+        self.flag(value is not None)
+        if value is not None:
+            self.string(value)
+
+    def strings(self, values: list[str]) -> None:
+        self.u32(len(values))
+        for value in values:
+            self.string(value)
+
+
+class _Reader:
+    def __init__(self, data: bytes) -> None:
+        self._data: memoryview = memoryview(data)
+        self._offset: int = 0
+
+    def u32(self) -> int:
+        value, = _U32.unpack_from(self._data, self._offset)
+        self._offset = self._offset + _U32.size
+        return value
+
+    def time(self) -> Optional[float]:
+        value, = _F64.unpack_from(self._data, self._offset)
+        self._offset = self._offset + _F64.size
+        return None if value == _NONE_TIME else value
+
+    def blob(self) -> bytes:
+        length: int = self.u32()
+        value: bytes = bytes(self._data[self._offset:self._offset + length])
+        self._offset = self._offset + length
+        return value
+
+    def string(self) -> str:
+        return bytes.decode(self.blob())
+
+    def flag(self) -> bool:
+        value: int = self._data[self._offset]
+        self._offset = self._offset + 1
+        return value != 0
+
+    def optional_string(self) -> Optional[str]:
+        return self.string() if self.flag() else None
+
+    def strings(self) -> list[str]:
+        return [self.string() for _ in range(self.u32())]
@@ -1,6 +1,8 @@
 from threading import Lock
 from typing import Callable
 
+SECRET_COMMANDS = ["PROFILE"]  # first argument is a password
+
 
 class CancellationToken:
     def __init__(self) -> None:
@@ -65,3 +67,11 @@ class MaxSizeList(object):
     @property
     def data(self):
         return self._data
+
+
+def hide_secrets(request: str) -> str:
+    words: list[str] = request.split(maxsplit=2)
+    if len(words) > 1 and words[0].upper() in SECRET_COMMANDS:
+        words[1] = "***"
+        return " ".join(words)
+    return request